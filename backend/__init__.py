@@ -0,0 +1,3 @@
+"""
+Backend package for the Personal Knowledge Vault.
+"""
@@ -3,6 +3,7 @@ Configuration and setup for the Personal Knowledge Vault.
 """
 
 import os
+import functools
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -28,6 +29,13 @@ class Config:
     
     # Retrieval settings
     RETRIEVAL_K = 4
+    QUERY_CACHE_SIZE = 512  # Cached answers for repeated questions
+    SOURCE_SNIPPET_CHARS = 200  # Source text shown per citation
+    SNIPPET_CACHE_SIZE = 2048  # Resolved source snippets kept in memory
+    
+    # Ingestion settings
+    EMBED_BATCH_SIZE = 100  # Chunks per embedding request (API maximum is 100)
+    LOAD_MAX_WORKERS = 8  # Files loaded concurrently
     
     # File limits
     MAX_FILE_SIZE_MB = 10
@@ -58,6 +66,7 @@ class Config:
         return str(cls.STORAGE_DIR)
 
 
+@functools.lru_cache(maxsize=1)
 def check_dependencies():
     """Check if all required dependencies are installed."""
     missing_deps = []
@@ -83,8 +92,9 @@ def check_dependencies():
     return True
 
 
+@functools.lru_cache(maxsize=1)
 def setup_environment():
-    """Setup the environment for the application."""
+    """Setup the environment for the application (runs once per process)."""
     # Create directories
     Config.setup_directories()
     
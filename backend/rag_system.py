@@ -5,28 +5,193 @@ Handles document processing, embedding, retrieval, and generation with memory.
 
 import os
 import json
+import atexit
+import threading
 import uuid
+import hashlib
+import logging
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from functools import cached_property, partial
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Callable, BinaryIO
 from pathlib import Path
 
-# LangChain imports
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import (
-    PyPDFLoader, 
-    TextLoader, 
-    Docx2txtLoader
-)
+# LangChain imports (model, vector store and loader packages are imported lazily)
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
 
-# Environment setup
-from dotenv import load_dotenv
-load_dotenv()
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Prefer orjson for chat history serialization, falling back to stdlib json
+try:
+    import orjson
+    
+    def _dumps_line(entry: Dict[str, Any]) -> bytes:
+        return orjson.dumps(entry, default=str) + b"\n"
+    
+    _loads = orjson.loads
+except ImportError:
+    def _dumps_line(entry: Dict[str, Any]) -> bytes:
+        return (json.dumps(entry, default=str) + "\n").encode()
+    
+    _loads = json.loads
+
+
+def _pdf_loader(path: str):
+    from langchain_community.document_loaders import PyPDFLoader
+    return PyPDFLoader(path)
+
+
+def _text_loader(path: str):
+    from langchain_community.document_loaders import TextLoader
+    return TextLoader(path)
+
+
+def _docx_loader(path: str):
+    from langchain_community.document_loaders import Docx2txtLoader
+    return Docx2txtLoader(path)
+
+
+# Document loader factory for each supported (lowercased) file extension
+LOADERS = {
+    '.pdf': _pdf_loader,
+    '.txt': _text_loader,
+    '.md': _text_loader,
+    '.docx': _docx_loader,
+    '.doc': _docx_loader,
+}
+
+
+def _parse_pdf_stream(stream: BinaryIO) -> List[Document]:
+    from pypdf import PdfReader
+    reader = PdfReader(stream)
+    return [
+        Document(page_content=page.extract_text(), metadata={"page": i})
+        for i, page in enumerate(reader.pages)
+    ]
+
+
+def _parse_text_stream(stream: BinaryIO) -> List[Document]:
+    return [Document(page_content=stream.read().decode("utf-8"))]
+
+
+def _parse_docx_stream(stream: BinaryIO) -> List[Document]:
+    import docx2txt
+    return [Document(page_content=docx2txt.process(stream))]
+
+
+# In-memory parser for each supported (lowercased) file extension,
+# producing the same documents as the matching entry in LOADERS
+STREAM_PARSERS = {
+    '.pdf': _parse_pdf_stream,
+    '.txt': _parse_text_stream,
+    '.md': _parse_text_stream,
+    '.docx': _parse_docx_stream,
+    '.doc': _parse_docx_stream,
+}
+
+
+class _SharedQueryCache:
+    """
+    LRU cache of query results for one storage directory, persisted on shutdown.
+    
+    Shared by every vault opened on the same directory in this process, so
+    an ingest through any of them clears the cached answers for all; version
+    counts those clears so vaults can drop their own derived caches too.
+    """
+    
+    def __init__(self, cache_file: Path, max_entries: int):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.version = 0
+        self._entries: Optional["OrderedDict[str, Dict[str, Any]]"] = None
+        self._dirty = False
+        self._lock = threading.Lock()
+    
+    def _load(self) -> "OrderedDict[str, Dict[str, Any]]":
+        """Entries, read from disk on first use (call with the lock held)."""
+        if self._entries is None:
+            try:
+                with open(self.cache_file, 'r') as f:
+                    entries = json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError):
+                entries = {}
+            self._entries = OrderedDict(list(entries.items())[-self.max_entries:])
+        return self._entries
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for a key, marking it recently used."""
+        with self._lock:
+            entries = self._load()
+            result = entries.get(key)
+            if result is not None:
+                entries.move_to_end(key)
+            return result
+    
+    def put(self, key: str, result: Dict[str, Any], version: int):
+        """
+        Cache a result, evicting the least recently used entry when full.
+        
+        version is the value seen before the result was computed; if the
+        cache was cleared since, the result may be stale and is dropped.
+        """
+        with self._lock:
+            if version != self.version:
+                return
+            entries = self._load()
+            entries[key] = result
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            self._dirty = True
+    
+    def clear(self):
+        """Drop cached answers, e.g. after the knowledge base changed."""
+        with self._lock:
+            self._entries = OrderedDict()
+            self._dirty = True
+            self.version += 1
+    
+    def save(self):
+        """Persist the cache so it survives restarts."""
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                with open(self.cache_file, 'w') as f:
+                    json.dump(self._entries, f, default=str)
+                self._dirty = False
+            except OSError:
+                pass
+
+
+# Query caches by resolved storage path, saved by a single exit handler
+_query_caches: Dict[Path, _SharedQueryCache] = {}
+_query_caches_lock = threading.Lock()
+
+
+def _get_query_cache(storage_path: Path) -> _SharedQueryCache:
+    """Return the process-wide query cache for a resolved storage path."""
+    with _query_caches_lock:
+        cache = _query_caches.get(storage_path)
+        if cache is None:
+            cache = _SharedQueryCache(storage_path / "query_cache.json", Config.QUERY_CACHE_SIZE)
+            _query_caches[storage_path] = cache
+        return cache
+
+
+def _save_query_caches():
+    """Persist every query cache opened in this process."""
+    for cache in list(_query_caches.values()):
+        cache.save()
+
+
+atexit.register(_save_query_caches)
 
 
 class PersonalKnowledgeVault:
@@ -34,34 +199,47 @@ class PersonalKnowledgeVault:
     Main RAG system with memory capabilities.
     """
     
-    def __init__(self, storage_path: str = "./storage"):
+    # Storage directories already created in this process
+    _created_paths = set()
+    
+    def __init__(self, storage_path: str = "./storage", history_window: int = 5):
         self.storage_path = Path(storage_path)
-        self.storage_path.mkdir(exist_ok=True)
+        resolved_path = self.storage_path.resolve()
+        if resolved_path not in self._created_paths:
+            self.storage_path.mkdir(exist_ok=True)
+            self._created_paths.add(resolved_path)
         
         # Check API key availability
-        if not os.getenv("GOOGLE_API_KEY"):
-            raise ValueError("Google API key is required. Set GOOGLE_API_KEY environment variable.")
-        
-        # Initialize components
-        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        self.llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.1)
+        Config.validate_api_keys()
         
-        # Vector store
-        self.vector_store = Chroma(
-            persist_directory=str(self.storage_path / "chroma_db"),
-            embedding_function=self.embeddings
-        )
+        # Embeddings, LLM and vector store are created on first use
         
         # Text splitter
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
+            chunk_size=Config.CHUNK_SIZE,
+            chunk_overlap=Config.CHUNK_OVERLAP,
             add_start_index=True
         )
         
         # Chat history
-        self.chat_history_file = self.storage_path / "chat_history.json"
-        self.chat_history = self._load_chat_history()
+        self.chat_history_file = self.storage_path / "chat_history.jsonl"
+        self._migrate_chat_history(self.storage_path / "chat_history.json")
+        self._chat_history = None  # Loaded lazily on first access
+        
+        # Recent messages used as conversation context
+        self._recent = deque(maxlen=max(5, history_window))
+        self._recent.extend(self._tail_chat_history(self._recent.maxlen))
+        self._ctx_cache: Optional[Tuple[int, str]] = None  # (max_messages, formatted)
+        
+        # Content snippets for source IDs referenced in chat history
+        self._snippet_cache: "OrderedDict[str, str]" = OrderedDict()
+        
+        # Answers for previously asked questions, shared by vaults on this storage path
+        self._query_cache = _get_query_cache(resolved_path)
+        
+        # Clears of the shared query cache seen so far; a newer count means
+        # another vault on this storage path changed the knowledge base
+        self._kb_version = self._query_cache.version
         
         # RAG prompt template
         self.rag_prompt = ChatPromptTemplate.from_messages([
@@ -78,117 +256,389 @@ class PersonalKnowledgeVault:
             ("human", "{question}")
         ])
         
-        # Build RAG chain
-        self.rag_chain = self._build_rag_chain()
+        self.output_parser = StrOutputParser()
     
-    def _load_chat_history(self) -> List[Dict[str, Any]]:
-        """Load chat history from JSON file."""
-        if self.chat_history_file.exists():
+    @cached_property
+    def embeddings(self):
+        """Embedding model, created on first use."""
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return GoogleGenerativeAIEmbeddings(model=Config.EMBEDDING_MODEL)
+    
+    @cached_property
+    def llm(self):
+        """Chat model, created on first use."""
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model=Config.LLM_MODEL,
+            temperature=Config.LLM_TEMPERATURE
+        )
+    
+    @cached_property
+    def vector_store(self):
+        """Chroma vector store, opened on first use."""
+        from langchain_chroma import Chroma
+        return Chroma(
+            persist_directory=str(self.storage_path / "chroma_db"),
+            embedding_function=self.embeddings
+        )
+    
+    @cached_property
+    def _metadata_index(self) -> Tuple[set, set]:
+        """Sources and content hashes of stored chunks, from a single metadata scan.
+        
+        A failed scan raises and is not cached, so the next access retries.
+        """
+        return self._load_metadata_index()
+    
+    @property
+    def _sources(self) -> set:
+        return self._metadata_index[0]
+    
+    @property
+    def _seen_hashes(self) -> set:
+        return self._metadata_index[1]
+    
+    def _sync_kb_version(self):
+        """Drop caches derived from the knowledge base if another vault changed it."""
+        if self._kb_version != self._query_cache.version:
+            self.__dict__.pop("_metadata_index", None)  # Rescanned on next access
+            self._kb_version = self._query_cache.version
+    
+    def _clear_query_cache(self):
+        """Drop cached answers, e.g. after the knowledge base changed."""
+        self._sync_kb_version()
+        self._query_cache.clear()
+        self._kb_version = self._query_cache.version
+    
+    @staticmethod
+    def _query_cache_key(question: str, chat_context: str) -> str:
+        """Cache key covering everything in the prompt besides retrieved context."""
+        return hashlib.sha256(f"{chat_context}\0{question}".encode()).hexdigest()
+    
+    @property
+    def chat_history(self) -> List[Dict[str, Any]]:
+        """Chat history, loaded from disk on first access."""
+        if self._chat_history is None:
+            self._chat_history = self._load_chat_history()
+        return self._chat_history
+    
+    @chat_history.setter
+    def chat_history(self, value: List[Dict[str, Any]]):
+        self._chat_history = value
+    
+    def _migrate_chat_history(self, legacy_file: Path):
+        """Convert a chat history saved as one JSON array to JSON Lines, once.
+        
+        Runs only while the JSON Lines file does not exist yet; the legacy
+        file is left in place.
+        """
+        if self.chat_history_file.exists() or not legacy_file.exists():
+            return
+        
+        try:
+            with open(legacy_file, 'r') as f:
+                entries = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return
+        
+        # Write to a temporary file so an interrupted conversion is retried
+        tmp_file = self.chat_history_file.with_suffix(".jsonl.tmp")
+        with open(tmp_file, 'wb') as f:
+            for entry in entries:
+                f.write(_dumps_line(entry))
+        os.replace(tmp_file, self.chat_history_file)
+    
+    def _iter_chat_history(self) -> Iterator[Dict[str, Any]]:
+        """Stream chat entries from the JSON Lines file one at a time."""
+        try:
+            with open(self.chat_history_file, 'rb') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield _loads(line)
+                    except ValueError:
+                        # Skip partially written or corrupt lines (JSON or UTF-8 errors)
+                        continue
+        except FileNotFoundError:
+            return
+    
+    def _tail_chat_history(self, n: int, block_size: int = 8192) -> List[Dict[str, Any]]:
+        """Read the last n chat entries by scanning the file backwards."""
+        try:
+            with open(self.chat_history_file, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                position = f.tell()
+                data = b""
+                
+                # Read blocks from the end until we have enough lines
+                while position > 0 and data.count(b"\n") <= n:
+                    read_size = min(block_size, position)
+                    position -= read_size
+                    f.seek(position)
+                    data = f.read(read_size) + data
+        except FileNotFoundError:
+            return []
+        
+        entries = []
+        for line in data.splitlines()[-(n + 1):]:
+            if not line.strip():
+                continue
             try:
-                with open(self.chat_history_file, 'r') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                return []
-        return []
+                entries.append(_loads(line))
+            except ValueError:
+                # First line may be cut mid-entry or mid-character; skip it
+                continue
+        
+        return entries[-n:]
     
-    def _save_chat_history(self):
-        """Save chat history to JSON file."""
-        with open(self.chat_history_file, 'w') as f:
-            json.dump(self.chat_history, f, indent=2, default=str)
+    def _load_chat_history(self) -> List[Dict[str, Any]]:
+        """Load chat history from JSON Lines file."""
+        return list(self._iter_chat_history())
+    
+    def _append_chat_entry(self, entry: Dict[str, Any]):
+        """Append a single chat entry to the JSON Lines file."""
+        with open(self.chat_history_file, 'ab') as f:
+            f.write(_dumps_line(entry))
     
     def _format_chat_context(self, max_messages: int = 5) -> str:
         """Format recent chat history for context."""
-        if not self.chat_history:
-            return "No previous conversation."
-        
-        recent_messages = self.chat_history[-max_messages:]
-        context_parts = []
+        if self._ctx_cache is not None and self._ctx_cache[0] == max_messages:
+            return self._ctx_cache[1]
         
-        for msg in recent_messages:
-            context_parts.append(f"Q: {msg['question']}")
-            context_parts.append(f"A: {msg['answer']}")
+        if not self._recent:
+            context = "No previous conversation."
+        else:
+            skip = max(0, len(self._recent) - max_messages)
+            context_parts = []
+            
+            for msg in islice(self._recent, skip, None):
+                context_parts.append(f"Q: {msg['question']}")
+                context_parts.append(f"A: {msg['answer']}")
+            
+            context = "\n".join(context_parts)
         
-        return "\n".join(context_parts)
+        self._ctx_cache = (max_messages, context)
+        return context
     
-    def _build_rag_chain(self):
-        """Build the RAG processing chain."""
-        def format_docs(docs):
-            return "\n\n".join(doc.page_content for doc in docs)
-        
-        retriever = self.vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 4}
+    def _generate_answer(self, question: str, docs: List[Document]) -> str:
+        """Generate an answer from already retrieved documents."""
+        context = "\n\n".join(doc.page_content for doc in docs)
+        messages = self.rag_prompt.format_messages(
+            context=context,
+            chat_context=self._format_chat_context(),
+            question=question
         )
+        return self.output_parser.invoke(self.llm.invoke(messages))
+    
+    @staticmethod
+    def _content_hash(text: str) -> str:
+        """Stable hash of chunk content used for deduplication."""
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    
+    def _load_metadata_index(self) -> Tuple[set, set]:
+        """Collect sources and content hashes of chunks already in the vector store."""
+        sources = set()
+        hashes = set()
+        results = self.vector_store.get(include=["metadatas"])
         
-        rag_chain = (
-            {
-                "context": retriever | format_docs,
-                "chat_context": lambda x: self._format_chat_context(),
-                "question": RunnablePassthrough()
-            }
-            | self.rag_prompt
-            | self.llm
-            | StrOutputParser()
-        )
+        for metadata in results.get("metadatas") or []:
+            if not metadata:
+                continue
+            if "source" in metadata:
+                sources.add(metadata["source"])
+            if "content_hash" in metadata:
+                hashes.add(metadata["content_hash"])
         
-        return rag_chain
+        return sources, hashes
     
-    def add_documents(self, file_paths: List[str]) -> Dict[str, Any]:
+    def _load_one(self, file_path: Path, added_date: str) -> Tuple[List[Document], Optional[str]]:
+        """
+        Load a single file and tag its documents with metadata.
+        
+        Args:
+            file_path: File to load
+            added_date: ISO timestamp shared by every document in the ingest
+            
+        Returns:
+            Tuple of (documents, error message or None)
+        """
+        try:
+            # Load document based on file type
+            make_loader = LOADERS.get(file_path.suffix.lower())
+            if make_loader is None:
+                return [], f"Unsupported file type: {file_path}"
+            
+            documents = make_loader(str(file_path)).load()
+            
+            # Add metadata
+            for doc in documents:
+                doc.metadata.update({
+                    "source": str(file_path.name),
+                    "added_date": added_date,
+                    "file_type": file_path.suffix
+                })
+            
+            return documents, None
+            
+        except Exception as e:
+            return [], f"Error processing {file_path}: {str(e)}"
+    
+    def _load_stream(self, name: str, stream: BinaryIO,
+                     added_date: str) -> Tuple[List[Document], Optional[str]]:
+        """
+        Parse an in-memory file and tag its documents with metadata.
+        
+        Args:
+            name: Original file name, used for the file type and source
+            stream: Binary file-like object with the file contents
+            added_date: ISO timestamp shared by every document in the ingest
+            
+        Returns:
+            Tuple of (documents, error message or None)
+        """
+        suffix = Path(name).suffix
+        try:
+            parse = STREAM_PARSERS.get(suffix.lower())
+            if parse is None:
+                return [], f"Unsupported file type: {name}"
+            
+            stream.seek(0)
+            documents = parse(stream)
+            
+            # Add metadata
+            for doc in documents:
+                doc.metadata.update({
+                    "source": name,
+                    "added_date": added_date,
+                    "file_type": suffix
+                })
+            
+            return documents, None
+            
+        except Exception as e:
+            return [], f"Error processing {name}: {str(e)}"
+    
+    def add_documents(self, file_paths: List[str],
+                      embed_batch_size: Optional[int] = None) -> Dict[str, Any]:
         """
         Add documents to the knowledge base.
         
+        Chunks from all files are embedded together, one embedding request
+        per batch of embed_batch_size chunks.
+        
         Args:
             file_paths: List of file paths to process
+            embed_batch_size: Chunks per embedding batch (defaults to Config.EMBED_BATCH_SIZE)
             
         Returns:
             Processing results with success/failure counts
         """
+        added_date = datetime.now().isoformat()
+        file_paths = [Path(p) for p in file_paths]
+        loaders = [
+            (file_path.name, partial(self._load_one, file_path, added_date))
+            for file_path in file_paths
+        ]
+        return self._ingest(loaders, embed_batch_size)
+    
+    def add_documents_from_streams(self, streams: List[Tuple[str, BinaryIO]],
+                                   embed_batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Add in-memory files to the knowledge base without writing them to disk.
+        
+        Args:
+            streams: List of (file name, binary file-like object) pairs
+            embed_batch_size: Chunks per embedding batch (defaults to Config.EMBED_BATCH_SIZE)
+            
+        Returns:
+            Processing results with success/failure counts
+        """
+        added_date = datetime.now().isoformat()
+        loaders = [
+            (name, partial(self._load_stream, name, stream, added_date))
+            for name, stream in streams
+        ]
+        return self._ingest(loaders, embed_batch_size)
+    
+    def _ingest(self, loaders: List[Tuple[str, Callable[[], Tuple[List[Document], Optional[str]]]]],
+                embed_batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """Load, split, deduplicate and store documents from (source name, loader) pairs."""
         results = {
             "processed": 0,
             "failed": 0,
             "errors": []
         }
         
-        for file_path in file_paths:
-            try:
-                # Load document based on file type
-                file_path = Path(file_path)
-                
-                if file_path.suffix.lower() == '.pdf':
-                    loader = PyPDFLoader(str(file_path))
-                elif file_path.suffix.lower() == '.txt':
-                    loader = TextLoader(str(file_path))
-                elif file_path.suffix.lower() in ['.docx', '.doc']:
-                    loader = Docx2txtLoader(str(file_path))
-                elif file_path.suffix.lower() == '.md':
-                    loader = TextLoader(str(file_path))
-                else:
-                    results["errors"].append(f"Unsupported file type: {file_path}")
+        all_docs: List[Document] = []
+        loaded_sources: List[str] = []
+        
+        # Load files concurrently; parsing is mostly I/O and native code
+        with ThreadPoolExecutor(max_workers=min(Config.LOAD_MAX_WORKERS, len(loaders) or 1)) as executor:
+            futures = [executor.submit(load) for _, load in loaders]
+            
+            for (name, _), future in zip(loaders, futures):
+                documents, error = future.result()
+                if error:
+                    results["errors"].append(error)
                     results["failed"] += 1
                     continue
                 
-                # Load and split documents
-                documents = loader.load()
-                
-                # Add metadata
-                for doc in documents:
-                    doc.metadata.update({
-                        "source": str(file_path.name),
-                        "added_date": datetime.now().isoformat(),
-                        "file_type": file_path.suffix
-                    })
-                
-                # Split documents
-                splits = self.text_splitter.split_documents(documents)
-                
-                # Add to vector store
-                self.vector_store.add_documents(splits)
-                
-                results["processed"] += 1
-                
+                all_docs.extend(documents)
+                loaded_sources.append(name)
+        
+        # Split documents from all files in one pass
+        all_splits = self.text_splitter.split_documents(all_docs)
+        
+        # Skip chunks whose content is already stored
+        self._sync_kb_version()
+        try:
+            seen_hashes = self._seen_hashes
+        except Exception as e:
+            results["errors"].append(f"Error reading vector store: {str(e)}")
+            results["failed"] += len(loaded_sources)
+            return results
+        
+        new_splits = []
+        batch_hashes = set()
+        for split in all_splits:
+            content_hash = self._content_hash(split.page_content)
+            if content_hash in seen_hashes or content_hash in batch_hashes:
+                continue
+            split.metadata["content_hash"] = content_hash
+            batch_hashes.add(content_hash)
+            new_splits.append(split)
+        
+        # Add to vector store in large batches to minimize embedding API calls
+        failed_sources = set()
+        stored_sources = set()
+        batch_size = embed_batch_size or Config.EMBED_BATCH_SIZE
+        for start in range(0, len(new_splits), batch_size):
+            batch = new_splits[start:start + batch_size]
+            try:
+                # Content hashes double as deterministic IDs, so re-ingest is idempotent
+                self.vector_store.add_documents(
+                    batch,
+                    ids=[doc.metadata["content_hash"] for doc in batch]
+                )
+                seen_hashes.update(doc.metadata["content_hash"] for doc in batch)
+                stored_sources.update(doc.metadata["source"] for doc in batch)
+                self._clear_query_cache()
             except Exception as e:
-                results["errors"].append(f"Error processing {file_path}: {str(e)}")
+                batch_sources = {doc.metadata["source"] for doc in batch}
+                results["errors"].append(
+                    f"Error adding {', '.join(sorted(batch_sources))} to vector store: {str(e)}"
+                )
+                failed_sources.update(batch_sources)
+        
+        for name in loaded_sources:
+            if name in failed_sources:
                 results["failed"] += 1
+            else:
+                results["processed"] += 1
+        
+        # Only sources with at least one stored chunk show up in a metadata scan
+        self._sources.update(stored_sources)
         
         return results
     
@@ -203,28 +653,44 @@ class PersonalKnowledgeVault:
             Response with answer, sources, and metadata
         """
         try:
-            # Get retrieved documents for source citation
-            retriever = self.vector_store.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": 4}
-            )
-            retrieved_docs = retriever.invoke(question)
+            # Repeated questions in the same conversation state are answered
+            # from the cache without API calls
+            chat_context = self._format_chat_context()
+            cache_key = self._query_cache_key(question, chat_context)
+            cache_version = self._query_cache.version
+            cached = self._query_cache.get(cache_key)
             
-            # Generate answer using RAG chain
-            answer = self.rag_chain.invoke(question)
-            
-            # Prepare sources
-            sources = []
-            for doc in retrieved_docs:
-                sources.append({
-                    "content": doc.page_content[:200] + "...",
-                    "source": doc.metadata.get("source", "Unknown"),
-                    "page": doc.metadata.get("page", None)
-                })
+            if cached is not None:
+                answer = cached["answer"]
+                sources = cached["sources"]
+            else:
+                # Get retrieved documents for source citation
+                retrieved_docs = self.vector_store.similarity_search(
+                    question, k=Config.RETRIEVAL_K
+                )
+                
+                # Generate answer from the same documents used for citations
+                answer = self._generate_answer(question, retrieved_docs)
+                
+                # Prepare sources, referencing chunks by ID so history stays small
+                sources = []
+                for doc in retrieved_docs:
+                    source = {
+                        "id": doc.metadata.get("content_hash"),
+                        "source": doc.metadata.get("source", "Unknown"),
+                        "page": doc.metadata.get("page", None)
+                    }
+                    if source["id"] is None:
+                        # Chunk stored without a content hash; keep the snippet inline
+                        source["content"] = self._snippet(doc.page_content)
+                    sources.append(source)
+                
+                result = {"answer": answer, "sources": sources}
+                self._query_cache.put(cache_key, result, cache_version)
             
             # Create chat entry
             chat_entry = {
-                "id": str(uuid.uuid4()),
+                "id": uuid.uuid4().hex,
                 "timestamp": datetime.now().isoformat(),
                 "question": question,
                 "answer": answer,
@@ -232,13 +698,17 @@ class PersonalKnowledgeVault:
             }
             
             # Add to chat history
-            self.chat_history.append(chat_entry)
-            self._save_chat_history()
+            self._recent.append(chat_entry)
+            self._ctx_cache = None
+            if self._chat_history is not None:
+                self._chat_history.append(chat_entry)
+            self._append_chat_entry(chat_entry)
             
             return {
                 "answer": answer,
                 "sources": sources,
                 "chat_id": chat_entry["id"],
+                "cached": cached is not None,
                 "success": True
             }
             
@@ -252,7 +722,10 @@ class PersonalKnowledgeVault:
             }
     
     def get_chat_history(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
-        """Get chat history, optionally limited to recent messages."""
+        """Get chat history, optionally limited to recent messages.
+        
+        The full history is read from disk on first call and cached.
+        """
         if limit:
             return self.chat_history[-limit:]
         return self.chat_history
@@ -260,7 +733,52 @@ class PersonalKnowledgeVault:
     def clear_chat_history(self):
         """Clear all chat history."""
         self.chat_history = []
-        self._save_chat_history()
+        self._recent.clear()
+        self._ctx_cache = None
+        # Truncate the history file
+        open(self.chat_history_file, 'w').close()
+    
+    @staticmethod
+    def _snippet(text: str) -> str:
+        return text[:Config.SOURCE_SNIPPET_CHARS] + "..."
+    
+    def get_source_snippets(self, ids: List[str]) -> Dict[str, str]:
+        """
+        Resolve source chunk IDs from chat history to content snippets.
+        
+        Snippets are fetched from the vector store in one ID lookup for all
+        IDs not seen before, and kept in a bounded LRU cache. IDs that are no
+        longer stored are cached as empty snippets so they are not looked up
+        again.
+        
+        Args:
+            ids: Chunk content hashes referenced by chat entries
+            
+        Returns:
+            Mapping of ID to snippet for every ID found in the vector store
+        """
+        missing = list({i for i in ids if i not in self._snippet_cache})
+        if missing:
+            try:
+                # Content hashes are the chunk IDs, so this is a primary-key lookup
+                results = self.vector_store.get(ids=missing, include=["documents"])
+                found = dict(zip(results["ids"], results["documents"]))
+                for i in missing:
+                    self._snippet_cache[i] = self._snippet(found[i]) if i in found else ""
+            except Exception as e:
+                logger.warning(f"Error fetching source snippets: {str(e)}")
+        
+        snippets = {}
+        for i in ids:
+            if i in self._snippet_cache:
+                self._snippet_cache.move_to_end(i)
+                if self._snippet_cache[i]:
+                    snippets[i] = self._snippet_cache[i]
+        
+        while len(self._snippet_cache) > Config.SNIPPET_CACHE_SIZE:
+            self._snippet_cache.popitem(last=False)
+        
+        return snippets
     
     def get_document_count(self) -> int:
         """Get the number of documents in the vector store."""
@@ -272,18 +790,10 @@ class PersonalKnowledgeVault:
     
     def list_sources(self) -> List[str]:
         """List all unique document sources in the knowledge base."""
+        self._sync_kb_version()
         try:
-            # Get all documents with metadata
-            results = self.vector_store.get()
-            sources = set()
-            
-            if results and 'metadatas' in results:
-                for metadata in results['metadatas']:
-                    if metadata and 'source' in metadata:
-                        sources.add(metadata['source'])
-            
-            return sorted(list(sources))
-        except:
+            return sorted(self._sources)
+        except Exception:
             return []
 
 
@@ -301,5 +811,7 @@ def test_rag_system():
     print("RAG system test completed!")
 
 
+# Run as a module from the project root: python -m backend.rag_system
+# (running the file directly breaks the package-relative imports)
 if __name__ == "__main__":
     test_rag_system()
@@ -3,13 +3,20 @@ Document processing utilities for the RAG system.
 """
 
 import os
+import re
+import functools
+import shutil
 import tempfile
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Characters not allowed in saved upload filenames
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^\w.\- ]+')
+
 
 class DocumentProcessor:
     """Handles document upload and validation."""
@@ -23,10 +30,15 @@ class DocumentProcessor:
         return Path(filename).suffix.lower() in cls.SUPPORTED_EXTENSIONS
     
     @classmethod
-    def validate_file_size(cls, file_path: str) -> bool:
-        """Check if file size is within limits."""
+    def validate_file_size(cls, file_path: str, stat_result: Optional[os.stat_result] = None) -> bool:
+        """Check if file size is within limits.
+        
+        Pass a stat_result already obtained for the file to skip the stat call.
+        """
         try:
-            return os.path.getsize(file_path) <= cls.MAX_FILE_SIZE
+            if stat_result is None:
+                stat_result = os.stat(file_path)
+            return stat_result.st_size <= cls.MAX_FILE_SIZE
         except OSError:
             return False
     
@@ -46,22 +58,26 @@ class DocumentProcessor:
         upload_path.mkdir(exist_ok=True)
         
         # Create safe filename
-        safe_filename = "".join(c for c in uploaded_file.name if c.isalnum() or c in '._- ')
+        safe_filename = _UNSAFE_FILENAME_CHARS.sub('', uploaded_file.name) or "upload.bin"
         file_path = upload_path / safe_filename
         
-        # Save file
+        # Stream to disk in 1MB chunks instead of buffering the whole upload
+        uploaded_file.seek(0)
         with open(file_path, 'wb') as f:
-            f.write(uploaded_file.getbuffer())
+            shutil.copyfileobj(uploaded_file, f, length=1024 * 1024)
         
         return str(file_path)
     
     @classmethod
-    def get_file_info(cls, file_path: str) -> Dict[str, Any]:
-        """Get file metadata."""
+    def get_file_info(cls, file_path: str, stat_result: Optional[os.stat_result] = None) -> Dict[str, Any]:
+        """Get file metadata.
+        
+        Pass a stat_result already obtained for the file to skip the stat call.
+        """
         path = Path(file_path)
         
         try:
-            stat = path.stat()
+            stat = stat_result if stat_result is not None else os.stat(path)
             return {
                 "name": path.name,
                 "size": stat.st_size,
@@ -113,6 +129,18 @@ class ChatHistoryManager:
         return "Unsupported export format"
 
 
+@functools.lru_cache(maxsize=4096)
+def format_timestamp(timestamp_str: str) -> str:
+    """Format an ISO timestamp for display (memoized, timestamps never change)."""
+    try:
+        if timestamp_str.endswith('Z'):
+            timestamp_str = timestamp_str[:-1] + '+00:00'
+        dt = datetime.fromisoformat(timestamp_str)
+        return dt.strftime("%Y-%m-%d %H:%M:%S")
+    except (AttributeError, ValueError):
+        return timestamp_str
+
+
 def create_sample_document():
     """Create a sample document for testing."""
     sample_content = """
@@ -4,15 +4,26 @@ A RAG application with memory for personal knowledge management using Google Gem
 """
 
 import streamlit as st
-import sys
 import os
 from pathlib import Path
-import tempfile
 import json
+import html
+import threading
 from datetime import datetime
+from typing import Optional
 
-# Add backend to path
-sys.path.append(str(Path(__file__).parent.parent / "backend"))
+from backend.config import Config
+from backend.utils import format_timestamp
+
+# Prefer orjson for the chat export, falling back to stdlib json
+try:
+    import orjson
+    
+    def _dumps_export(data) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def _dumps_export(data) -> bytes:
+        return json.dumps(data, indent=2).encode()
 
 # Configure page
 st.set_page_config(
@@ -22,8 +33,23 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Questions offered on an empty chat
+SAMPLE_QUESTIONS = (
+    "What are the main topics in my documents?",
+    "Can you summarize the key points?",
+    "What does the document say about [specific topic]?",
+    "Compare different viewpoints mentioned in the documents",
+)
+
+# Markup for one retrieved source inside the sources expander
+# (content snippets are already truncated by the backend)
+SOURCE_TEMPLATE = (
+    '<div class="source-box"><strong>Source {i}:</strong> {source}<br>'
+    '<em>Content:</em> {content}</div>'
+)
+
 # Custom CSS
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -32,20 +58,6 @@ st.markdown("""
         color: #1f77b4;
         margin-bottom: 2rem;
     }
-    .chat-message {
-        padding: 1rem;
-        margin: 0.5rem 0;
-        border-radius: 0.5rem;
-        border-left: 4px solid #1f77b4;
-    }
-    .user-message {
-        background-color: #f0f2f6;
-        border-left-color: #28a745;
-    }
-    .assistant-message {
-        background-color: #ffffff;
-        border-left-color: #1f77b4;
-    }
     .source-box {
         background-color: #f8f9fa;
         padding: 0.5rem;
@@ -55,7 +67,16 @@ st.markdown("""
         font-size: 0.9rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+
+def inject_css():
+    """Inject the custom CSS.
+    
+    This has to run on every rerun: Streamlit removes elements that a run
+    does not emit again, so skipping it would drop the styles.
+    """
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 
 def initialize_session_state():
@@ -66,24 +87,88 @@ def initialize_session_state():
         st.session_state.chat_history = []
 
 
-def initialize_rag_system():
-    """Initialize the RAG system with error handling."""
+@st.cache_resource(show_spinner=False)
+def _get_vault_cls():
+    """Import the RAG backend once per process (cached across reruns)."""
+    from backend.rag_system import PersonalKnowledgeVault
+    return PersonalKnowledgeVault
+
+
+def start_rag_system_init():
+    """Start building the RAG system in a background thread."""
+    if st.session_state.rag_system is not None or 'rag_init' in st.session_state:
+        return
+    
+    # Plain dict shared with the worker thread, which must not call st.*
+    state = {"vault": None, "error": None}
+    
     try:
-        from rag_system import PersonalKnowledgeVault
-        
-        if st.session_state.rag_system is None:
-            with st.spinner("Initializing Knowledge Vault..."):
-                st.session_state.rag_system = PersonalKnowledgeVault(
-                    storage_path="./storage"
-                )
-        return True
+        vault_cls = _get_vault_cls()
     except Exception as e:
-        st.error(f"Failed to initialize RAG system: {str(e)}")
+        vault_cls = None
+        state["error"] = e
+    
+    def build():
+        if vault_cls is None:
+            return
+        try:
+            vault = vault_cls(storage_path="./storage")
+            # Warm up the vector store and LLM clients off the script thread
+            # (assigned so Streamlit magic does not st.write them)
+            _ = vault.vector_store
+            _ = vault.llm
+            state["vault"] = vault
+        except Exception as e:
+            state["error"] = e
+    
+    state["thread"] = threading.Thread(target=build, daemon=True)
+    state["thread"].start()
+    st.session_state.rag_init = state
+
+
+def initialize_rag_system():
+    """
+    Initialize the RAG system with error handling.
+    
+    Returns:
+        True when ready, False on failure, None while still initializing
+    """
+    if st.session_state.rag_system is not None:
+        return True
+    
+    start_rag_system_init()
+    state = st.session_state.rag_init
+    if state["thread"].is_alive():
+        return None
+    
+    # Allow a retry on the next run
+    del st.session_state.rag_init
+    
+    if state["error"] is not None:
+        st.error(f"Failed to initialize RAG system: {str(state['error'])}")
         return False
+    
+    st.session_state.rag_system = state["vault"]
+    return True
+
+
+def wait_for_rag_system():
+    """Block until background initialization finishes, then rerun."""
+    with st.spinner("Initializing Knowledge Vault..."):
+        st.session_state.rag_init["thread"].join()
+    st.rerun()
 
 
-def render_sidebar():
-    """Render the sidebar with document upload and system info."""
+def render_sidebar(doc_count: Optional[int] = None) -> Optional[int]:
+    """
+    Render the sidebar with document upload and system info.
+    
+    Args:
+        doc_count: Document count already fetched for this run
+        
+    Returns:
+        The document count shown, refreshed if documents were added
+    """
     st.sidebar.markdown("## 📚 Knowledge Management")
     
     # Document upload section
@@ -98,11 +183,13 @@ def render_sidebar():
     if uploaded_files:
         if st.sidebar.button("Process Documents", type="primary"):
             process_uploaded_files(uploaded_files)
+            doc_count = None  # Stale after ingest
     
     # Knowledge base info
     st.sidebar.markdown("### 📊 Knowledge Base Stats")
     if st.session_state.rag_system:
-        doc_count = st.session_state.rag_system.get_document_count()
+        if doc_count is None:
+            doc_count = st.session_state.rag_system.get_document_count()
         sources = st.session_state.rag_system.list_sources()
         
         st.sidebar.metric("Documents", doc_count)
@@ -124,7 +211,7 @@ def render_sidebar():
         st.session_state.chat_history = []
         st.rerun()
     
-    if st.sidebar.button("Export Chat History"):
+    with st.sidebar:
         export_chat_history()
     
     # System settings
@@ -133,6 +220,8 @@ def render_sidebar():
     # API key check
     api_key_status = "✅ Set" if os.getenv("GOOGLE_API_KEY") else "❌ Missing"
     st.sidebar.text(f"Google API Key: {api_key_status}")
+    
+    return doc_count
 
 
 def process_uploaded_files(uploaded_files):
@@ -141,21 +230,15 @@ def process_uploaded_files(uploaded_files):
         st.error("RAG system not initialized")
         return
     
-    # Create temporary directory for uploaded files
-    temp_dir = tempfile.mkdtemp()
-    file_paths = []
-    
     try:
-        # Save uploaded files
-        for uploaded_file in uploaded_files:
-            file_path = os.path.join(temp_dir, uploaded_file.name)
-            with open(file_path, 'wb') as f:
-                f.write(uploaded_file.getbuffer())
-            file_paths.append(file_path)
+        # Hand the in-memory uploads straight to the backend, no temp files
+        streams = [(uploaded_file.name, uploaded_file) for uploaded_file in uploaded_files]
         
-        # Process files
-        with st.spinner(f"Processing {len(file_paths)} documents..."):
-            results = st.session_state.rag_system.add_documents(file_paths)
+        # Process files (the backend parses files in parallel and batches embeddings)
+        with st.spinner(f"Processing {len(streams)} documents..."):
+            results = st.session_state.rag_system.add_documents_from_streams(
+                streams, embed_batch_size=Config.EMBED_BATCH_SIZE
+            )
         
         # Show results
         if results["processed"] > 0:
@@ -168,11 +251,6 @@ def process_uploaded_files(uploaded_files):
     
     except Exception as e:
         st.error(f"Error processing files: {str(e)}")
-    
-    finally:
-        # Cleanup temporary files
-        import shutil
-        shutil.rmtree(temp_dir, ignore_errors=True)
 
 
 def render_chat_interface():
@@ -180,56 +258,69 @@ def render_chat_interface():
     st.markdown('<div class="main-header">📚 Personal Knowledge Vault</div>', 
                 unsafe_allow_html=True)
     
-    # Chat input
+    # Chat input (sample question buttons queue a pending question)
     user_question = st.chat_input("Ask me anything about your documents...")
+    if not user_question:
+        user_question = st.session_state.pop("pending_question", None)
+    
+    # Display chat history, then render the new turn in place
+    display_chat_history(show_welcome=not user_question)
     
     if user_question:
         handle_user_question(user_question)
-    
-    # Display chat history
-    display_chat_history()
 
 
 def handle_user_question(question: str):
-    """Handle user question and generate response."""
+    """Handle user question and render the new turn without a full rerun."""
     if not st.session_state.rag_system:
         st.error("Please wait for the system to initialize.")
         return
     
+    user_message = st.chat_message("user")
+    user_message.write(question)
+    
     # Get response from RAG system
     with st.spinner("Thinking..."):
         response = st.session_state.rag_system.query(question)
     
-    # Update session state
-    st.session_state.chat_history = st.session_state.rag_system.get_chat_history()
-    
     # Show error if query failed
     if not response.get("success", True):
         st.error(f"Query failed: {response.get('error', 'Unknown error')}")
+        return
     
-    st.rerun()
+    # Update session state
+    st.session_state.chat_history = st.session_state.rag_system.get_chat_history()
+    
+    entry = st.session_state.chat_history[-1]
+    user_message.caption(f"🕒 {format_timestamp(entry.get('timestamp'))}")
+    render_assistant_message(entry, resolve_source_snippets([entry]))
 
 
-def display_chat_history():
-    """Display the chat history."""
+@st.fragment
+def display_chat_history(show_welcome: bool = True):
+    """Display the chat history.
+    
+    Runs as a fragment, so widgets inside it rerun only this function.
+    """
     if not st.session_state.chat_history:
+        if not show_welcome:
+            return
+        
         st.info("👋 Welcome! Upload some documents and start asking questions about them.")
         
         # Show sample questions if no history
         st.markdown("### 💡 Sample Questions")
-        sample_questions = [
-            "What are the main topics in my documents?",
-            "Can you summarize the key points?",
-            "What does the document say about [specific topic]?",
-            "Compare different viewpoints mentioned in the documents"
-        ]
-        
-        for question in sample_questions:
-            if st.button(question, key=f"sample_{question}"):
-                handle_user_question(question)
+        for i, question in enumerate(SAMPLE_QUESTIONS):
+            if st.button(question, key=f"sq_{i}"):
+                # Asking needs the full app run, not just this fragment
+                st.session_state.pending_question = question
+                st.rerun()
         
         return
     
+    # Resolve source snippets for all turns in one backend call
+    snippets = resolve_source_snippets(st.session_state.chat_history)
+    
     # Display chat messages
     for entry in st.session_state.chat_history:
         # User message
@@ -237,24 +328,57 @@ def display_chat_history():
             st.write(entry["question"])
             st.caption(f"🕒 {format_timestamp(entry.get('timestamp'))}")
         
-        # Assistant message
-        with st.chat_message("assistant"):
-            st.write(entry["answer"])
-            
-            # Show sources if available
-            if entry.get("sources"):
-                with st.expander(f"📖 Sources ({len(entry['sources'])})", expanded=False):
-                    for i, source in enumerate(entry["sources"], 1):
-                        st.markdown(f"""
-                        <div class="source-box">
-                            <strong>Source {i}:</strong> {source.get('source', 'Unknown')}<br>
-                            <em>Content:</em> {source.get('content', '')[:200]}...
-                        </div>
-                        """, unsafe_allow_html=True)
+        render_assistant_message(entry, snippets)
+
 
+def resolve_source_snippets(entries) -> dict:
+    """Look up content snippets for the source IDs referenced by entries."""
+    ids = [
+        source["id"]
+        for entry in entries
+        for source in entry.get("sources", [])
+        if source.get("id")
+    ]
+    if not ids or not st.session_state.rag_system:
+        return {}
+    return st.session_state.rag_system.get_source_snippets(ids)
 
+
+def render_assistant_message(entry, snippets: dict):
+    """Render an assistant answer with its sources.
+    
+    Sources reference chunks by ID; their content comes from snippets.
+    Older entries may still carry their content inline.
+    """
+    with st.chat_message("assistant"):
+        st.write(entry["answer"])
+        
+        # Show sources if available
+        if entry.get("sources"):
+            with st.expander(f"📖 Sources ({len(entry['sources'])})", expanded=False):
+                # One markdown element for all sources; escape document text
+                st.markdown("\n".join(
+                    SOURCE_TEMPLATE.format(
+                        i=i,
+                        source=html.escape(source.get('source', 'Unknown')),
+                        content=html.escape(
+                            source.get('content') or snippets.get(source.get('id'), '')
+                        )
+                    )
+                    for i, source in enumerate(entry["sources"], 1)
+                ), unsafe_allow_html=True)
+
+
+@st.fragment
 def export_chat_history():
-    """Export chat history as downloadable file."""
+    """Export chat history as downloadable file.
+    
+    Runs as a fragment, so the export is only built when requested and
+    clicking its buttons does not rerun the rest of the app.
+    """
+    if not st.button("Export Chat History"):
+        return
+    
     if not st.session_state.chat_history:
         st.warning("No chat history to export")
         return
@@ -270,25 +394,16 @@ def export_chat_history():
         })
     
     # Create downloadable file
-    export_text = json.dumps(export_data, indent=2)
+    export_bytes = _dumps_export(export_data)
     
     st.download_button(
         label="📥 Download Chat History",
-        data=export_text,
+        data=export_bytes,
         file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
         mime="application/json"
     )
 
 
-def format_timestamp(timestamp_str: str) -> str:
-    """Format timestamp for display."""
-    try:
-        dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-        return dt.strftime("%Y-%m-%d %H:%M:%S")
-    except:
-        return timestamp_str
-
-
 def create_sample_environment():
     """Create sample documents for testing."""
     sample_content = """
@@ -339,6 +454,7 @@ Happy learning!
 
 def main():
     """Main application function."""
+    inject_css()
     initialize_session_state()
     
     # Check for API key
@@ -360,16 +476,25 @@ def main():
         """)
         st.stop()
     
-    # Initialize RAG system
-    if not initialize_rag_system():
+    # Initialize RAG system in the background so the UI renders immediately
+    status = initialize_rag_system()
+    if status is False:
         st.stop()
     
+    # Fetch the document count once for the sidebar and the sample-doc gate
+    doc_count = None
+    if status:
+        doc_count = st.session_state.rag_system.get_document_count()
+    
     # Render interface
-    render_sidebar()
+    doc_count = render_sidebar(doc_count)
     render_chat_interface()
     
+    if status is None:
+        wait_for_rag_system()
+    
     # Add sample document if knowledge base is empty
-    if st.session_state.rag_system.get_document_count() == 0:
+    if doc_count == 0:
         with st.sidebar:
             if st.button("📝 Add Sample Document", help="Add a sample document to get started"):
                 sample_file = create_sample_environment()
@@ -27,6 +27,7 @@ pip install --upgrade pip
 # Install requirements
 echo "📥 Installing dependencies..."
 pip install -r requirements.txt
+pip install -e .
 
 # Create necessary directories
 echo "📁 Creating directories..."
@@ -4,11 +4,10 @@ Test script for the Personal Knowledge Vault application.
 
 import sys
 import os
+import io
+import tempfile
 from pathlib import Path
 
-# Add backend to path
-sys.path.append(str(Path(__file__).parent / "backend"))
-
 def test_rag_system():
     """Test the RAG system (requires API key)."""
     print("🔧 Testing RAG System...")
@@ -66,6 +65,371 @@ def test_configuration():
         return False
 
 
+def make_test_vault(storage_path):
+    """Create a vault without network access (models are never loaded)."""
+    from backend.config import Config
+    from backend.rag_system import PersonalKnowledgeVault
+    
+    api_key = Config.GOOGLE_API_KEY
+    Config.GOOGLE_API_KEY = api_key or "test-key"
+    try:
+        return PersonalKnowledgeVault(storage_path)
+    finally:
+        Config.GOOGLE_API_KEY = api_key
+
+
+def test_chat_history_tail():
+    """Test reading recent chat entries backwards across block boundaries."""
+    print("💬 Testing Chat History Tail...")
+    
+    try:
+        with tempfile.TemporaryDirectory() as storage_path:
+            vault = make_test_vault(storage_path)
+            for i in range(50):
+                vault._append_chat_entry({"question": f"q{i}", "answer": "a" * i})
+            
+            # Small blocks split entries, so the scan must stitch them together
+            tail = vault._tail_chat_history(5, block_size=64)
+            assert [e["question"] for e in tail] == [f"q{i}" for i in range(45, 50)]
+            assert len(vault._tail_chat_history(100, block_size=64)) == 50
+            
+            # A new vault seeds its conversation context from the tail
+            vault = make_test_vault(storage_path)
+            assert vault._recent[-1]["question"] == "q49"
+            assert len(vault.get_chat_history()) == 50
+        
+        print("✅ Chat history tail test passed!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat history tail test failed: {e!r}")
+        return False
+
+
+class FakeVectorStore:
+    """In-memory stand-in for Chroma that can fail selected add calls."""
+    
+    def __init__(self, fail_calls=()):
+        self.fail_calls = set(fail_calls)
+        self.calls = 0
+        self.docs = {}
+        self.get_calls = []
+        self.fail_get = False
+    
+    def get(self, ids=None, include=None, **kwargs):
+        self.get_calls.append(ids)
+        if self.fail_get:
+            raise RuntimeError("vector store unavailable")
+        docs = [(i, d) for i, d in self.docs.items() if ids is None or i in ids]
+        return {
+            "ids": [i for i, _ in docs],
+            "documents": [d.page_content for _, d in docs],
+            "metadatas": [d.metadata for _, d in docs],
+        }
+    
+    def add_documents(self, documents, ids):
+        self.calls += 1
+        if self.calls in self.fail_calls:
+            raise RuntimeError("embedding request failed")
+        self.docs.update(zip(ids, documents))
+    
+    def similarity_search(self, query, k=4):
+        return list(self.docs.values())[:k]
+
+
+def test_ingest_batching():
+    """Test that chunks are sent in batches and failures are counted per batch."""
+    print("📁 Testing Ingestion Batching...")
+    
+    try:
+        with tempfile.TemporaryDirectory() as storage_path:
+            vault = make_test_vault(storage_path)
+            vault.vector_store = FakeVectorStore(fail_calls={2})
+            
+            results = vault.add_documents_from_streams([
+                ("a.txt", io.BytesIO(b"Alpha content.")),
+                ("b.txt", io.BytesIO(b"Beta content.")),
+                ("c.txt", io.BytesIO(b"Gamma content.")),
+                ("d.xyz", io.BytesIO(b"Unsupported.")),
+            ], embed_batch_size=2)
+            
+            # Three chunks in batches of two; only c.txt is in the failed batch
+            assert vault.vector_store.calls == 2
+            assert len(vault.vector_store.docs) == 2
+            assert results["processed"] == 2, results
+            assert results["failed"] == 2, results
+            assert len(results["errors"]) == 2, results
+        
+        print("✅ Ingestion batching test passed!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ingestion batching test failed: {e!r}")
+        return False
+
+
+def test_ingest_dedupe():
+    """Test that chunks already stored or repeated in an ingest are skipped."""
+    print("🔁 Testing Ingestion Deduplication...")
+    
+    try:
+        with tempfile.TemporaryDirectory() as storage_path:
+            vault = make_test_vault(storage_path)
+            vault.vector_store = FakeVectorStore()
+            
+            results = vault.add_documents_from_streams([
+                ("a.txt", io.BytesIO(b"Alpha content.")),
+                ("copy.txt", io.BytesIO(b"Alpha content.")),
+            ])
+            assert results["processed"] == 2, results
+            assert len(vault.vector_store.docs) == 1
+            
+            # Re-ingesting unchanged content makes no vector store call
+            vault.add_documents_from_streams([("a.txt", io.BytesIO(b"Alpha content."))])
+            assert vault.vector_store.calls == 1
+            
+            # A new vault picks up stored hashes from the metadata scan
+            store = vault.vector_store
+            vault = make_test_vault(storage_path)
+            vault.vector_store = store
+            vault.add_documents_from_streams([("a.txt", io.BytesIO(b"Alpha content."))])
+            assert store.calls == 1
+        
+        print("✅ Ingestion deduplication test passed!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ingestion deduplication test failed: {e!r}")
+        return False
+
+
+def test_ingest_ids():
+    """Test that stored chunks use their content hash as the ID."""
+    print("🆔 Testing Deterministic Chunk IDs...")
+    
+    try:
+        import hashlib
+        
+        with tempfile.TemporaryDirectory() as storage_path:
+            vault = make_test_vault(storage_path)
+            vault.vector_store = FakeVectorStore()
+            vault.add_documents_from_streams([("a.txt", io.BytesIO(b"Alpha content."))])
+            
+            expected = hashlib.blake2b(b"Alpha content.", digest_size=16).hexdigest()
+            (chunk_id, doc), = vault.vector_store.docs.items()
+            assert chunk_id == expected
+            assert doc.metadata["content_hash"] == expected
+        
+        print("✅ Deterministic chunk ID test passed!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Deterministic chunk ID test failed: {e!r}")
+        return False
+
+
+def test_list_sources():
+    """Test that only sources with stored chunks are listed."""
+    print("📚 Testing Source Listing...")
+    
+    try:
+        with tempfile.TemporaryDirectory() as storage_path:
+            vault = make_test_vault(storage_path)
+            vault.vector_store = FakeVectorStore(fail_calls={2})
+            
+            vault.add_documents_from_streams([
+                ("a.txt", io.BytesIO(b"Alpha content.")),
+                ("copy.txt", io.BytesIO(b"Alpha content.")),
+                ("b.txt", io.BytesIO(b"Beta content.")),
+            ], embed_batch_size=1)
+            
+            # copy.txt stored nothing new and b.txt was in the failed batch
+            assert vault.list_sources() == ["a.txt"]
+            
+            # A new vault's metadata scan agrees with the in-memory set
+            store = vault.vector_store
+            vault = make_test_vault(storage_path)
+            vault.vector_store = store
+            assert vault.list_sources() == ["a.txt"]
+        
+        print("✅ Source listing test passed!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Source listing test failed: {e!r}")
+        return False
+
+
+class FakeLLM:
+    """Chat model stand-in returning canned answers, with an optional hook."""
+    
+    def __init__(self, responses, on_invoke=None):
+        self.responses = list(responses)
+        self.on_invoke = on_invoke
+    
+    def invoke(self, messages):
+        if self.on_invoke:
+            self.on_invoke()
+        return self.responses.pop(0)
+
+
+def test_query_cache():
+    """Test the answer cache shared by vaults on one storage path."""
+    print("🗄️ Testing Query Cache...")
+    
+    try:
+        from backend import rag_system
+        from backend.rag_system import _SharedQueryCache
+        
+        # Least recently used entries are evicted; stale puts are dropped
+        with tempfile.TemporaryDirectory() as storage_path:
+            cache = _SharedQueryCache(Path(storage_path) / "query_cache.json", max_entries=2)
+            cache.put("a", {"answer": "a"}, cache.version)
+            cache.put("b", {"answer": "b"}, cache.version)
+            cache.get("a")
+            cache.put("c", {"answer": "c"}, cache.version)
+            assert cache.get("b") is None and cache.get("a") == {"answer": "a"}
+            
+            version = cache.version
+            cache.clear()
+            cache.put("d", {"answer": "d"}, version)
+            assert cache.get("d") is None
+        
+        with tempfile.TemporaryDirectory() as storage_path:
+            store = FakeVectorStore()
+            vault_a = make_test_vault(storage_path)
+            vault_b = make_test_vault(storage_path)
+            for vault in (vault_a, vault_b):
+                vault.vector_store = store
+            vault_a.add_documents_from_streams([("one.txt", io.BytesIO(b"Old content."))])
+            
+            # Same question in the same conversation state hits, across vaults
+            vault_a.llm = FakeLLM(["a1", "a2", "a3", "a4", "a5"])
+            assert vault_a.query("what?")["cached"] is False
+            result = vault_b.query("what?")
+            assert result["cached"] is True and result["answer"] == "a1"
+            
+            # A follow-up after another turn is a different conversation state
+            assert vault_a.query("what?")["cached"] is False
+            
+            # An ingest through vault B invalidates vault A's answers
+            vault_b.add_documents_from_streams([("two.txt", io.BytesIO(b"New content."))])
+            vault_a.clear_chat_history()
+            result = vault_a.query("what?")
+            assert result["cached"] is False and result["answer"] == "a3"
+            assert vault_a.list_sources() == ["one.txt", "two.txt"]
+            
+            # An answer built while another vault ingests is not cached
+            vault_a.clear_chat_history()
+            vault_a.llm.on_invoke = lambda: vault_b.add_documents_from_streams(
+                [("three.txt", io.BytesIO(b"Newer content."))]
+            )
+            vault_a.query("race?")
+            vault_a.llm.on_invoke = None
+            vault_a.clear_chat_history()
+            result = vault_a.query("race?")
+            assert result["cached"] is False and result["answer"] == "a5"
+            
+            # Cached answers survive a restart through query_cache.json
+            rag_system._save_query_caches()
+            rag_system._query_caches.clear()
+            vault_c = make_test_vault(storage_path)
+            vault_c.vector_store = store
+            vault_c.clear_chat_history()
+            result = vault_c.query("race?")
+            assert result["cached"] is True and result["answer"] == "a5"
+        
+        print("✅ Query cache test passed!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Query cache test failed: {e!r}")
+        return False
+
+
+def test_source_snippets():
+    """Test resolving source chunk IDs to cached content snippets."""
+    print("📖 Testing Source Snippets...")
+    
+    try:
+        from backend.config import Config
+        
+        with tempfile.TemporaryDirectory() as storage_path:
+            vault = make_test_vault(storage_path)
+            store = vault.vector_store = FakeVectorStore()
+            vault.add_documents_from_streams([
+                ("a.txt", io.BytesIO(b"Alpha content.")),
+                ("b.txt", io.BytesIO(b"Beta content.")),
+            ])
+            alpha, beta = store.docs
+            
+            # Found IDs resolve in one lookup; deleted chunks are remembered
+            store.get_calls.clear()
+            assert vault.get_source_snippets([alpha, "deleted"]) == {alpha: "Alpha content...."}
+            assert sorted(store.get_calls[0]) == sorted([alpha, "deleted"])
+            vault.get_source_snippets([alpha, "deleted"])
+            assert len(store.get_calls) == 1
+            
+            # A failed lookup is not cached, so the next call retries
+            store.fail_get = True
+            assert vault.get_source_snippets([beta]) == {}
+            store.fail_get = False
+            assert vault.get_source_snippets([beta]) == {beta: "Beta content...."}
+            assert len(store.get_calls) == 3
+            
+            # The cache is trimmed to the configured size
+            cache_size = Config.SNIPPET_CACHE_SIZE
+            Config.SNIPPET_CACHE_SIZE = 1
+            try:
+                vault.get_source_snippets([alpha])
+                assert list(vault._snippet_cache) == [alpha]
+            finally:
+                Config.SNIPPET_CACHE_SIZE = cache_size
+        
+        print("✅ Source snippets test passed!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Source snippets test failed: {e!r}")
+        return False
+
+
+def test_chat_history_migration():
+    """Test converting a legacy chat_history.json array to JSON Lines."""
+    print("🗃️ Testing Chat History Migration...")
+    
+    try:
+        import json
+        
+        with tempfile.TemporaryDirectory() as storage_path:
+            legacy_file = Path(storage_path) / "chat_history.json"
+            entries = [
+                {"id": f"id-{i}", "question": f"q{i}", "answer": "é",
+                 "sources": [{"source": "a.txt", "content": "Alpha..."}]}
+                for i in range(3)
+            ]
+            with open(legacy_file, 'w') as f:
+                json.dump(entries, f, indent=2)
+            
+            vault = make_test_vault(storage_path)
+            assert vault.get_chat_history() == entries
+            assert [e["question"] for e in vault._recent] == ["q0", "q1", "q2"]
+            assert legacy_file.exists()
+            
+            # Once converted, the legacy file is not migrated again
+            vault.clear_chat_history()
+            vault = make_test_vault(storage_path)
+            assert vault.get_chat_history() == []
+            assert not vault._recent
+        
+        print("✅ Chat history migration test passed!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat history migration test failed: {e!r}")
+        return False
+
+
 def main():
     """Run all tests."""
     print("🧪 Running Personal Knowledge Vault Tests")
@@ -73,6 +437,14 @@ def main():
     
     tests = [
         test_configuration,
+        test_chat_history_tail,
+        test_ingest_batching,
+        test_ingest_dedupe,
+        test_ingest_ids,
+        test_list_sources,
+        test_query_cache,
+        test_source_snippets,
+        test_chat_history_migration,
         test_rag_system
     ]
     